@@ -1,16 +1,27 @@
-import matplotlib.pyplot as plt
 import networkx as nx
-import copy
 import numpy as np
 import random as rd
+import os
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 class Line():
     def __init__(self, task_list):
         self.graph = self.draw_graph(task_list)
         self.task_list = task_list
         self.input_dictionary = self.create_input_dict(task_list)
+        self.times = self.create_time_array(task_list)
+        self.create_adjacency_arrays(self.graph)
+        self.topological_order = self.create_topological_order()
+        self.reachable = self.create_reachable_masks()
+        self.total_weight = self.create_total_weights()
+        self.reversed_total_weight = self.create_reversed_total_weights()
+        # number of tasks reachable from each task, itself included
+        self.successor_count = np.array([bin(mask).count('1') for mask in self.reachable])
+        # heuristic results are deterministic, keyed by (cycle_time, method)
+        self.heuristic_results = {}
 
     def get_task_time(self, task_number):
-        return self.graph.nodes[task_number]['time']
+        return self.times[task_number].item()
     
     def draw_graph(self, task_list):
         drawed_graph = nx.DiGraph()
@@ -19,48 +30,17 @@ class Line():
         drawed_graph.add_node(0, time=0)
         for node in task_list:
             drawed_graph.add_node(node[0], time=node[2])
-            for successors in node[1]:
+            # a task without predecessors hangs from the dummy start node, same as [0]
+            for successors in node[1] or [0]:
                 drawed_graph.add_edge(successors, node[0])
 
         node_list = list(nx.topological_sort(drawed_graph))
         for i in node_list:
-            if (i != -1)&(len(list(drawed_graph.successors(i))) == 0):
+            if (i != -1) and (drawed_graph.out_degree(i) == 0):
                   drawed_graph.add_edge(i, -1)
 
-        drawed_graph.nodes[0]['total_weight'] = 0
-
-        #calculate total_weights
-        for i in range(1, len(task_list)+1):
-            node_list = list(nx.dfs_preorder_nodes(drawed_graph, source=i))
-            total_weight = 0
-            for node in node_list:
-                total_weight += drawed_graph.nodes[node]['time']
-            drawed_graph.nodes[i]['total_weight'] = total_weight
-
         return drawed_graph
     
-    def create_graph_for_ushape(self, input_array, graph):    
-        reverse_graph = nx.DiGraph()
-        # draw reverse graph and addreversed task times
-        reverse_graph.add_node(0, time=0)
-        for node in input_x:
-            for successors in node[1]:
-                reverse_graph.add_node(node[0], time=node[2])
-                reverse_graph.add_edge(node[0], successors)
-
-
-        reverse_graph.nodes[0]['total_weight'] = 0
-
-        #calculate reversed_total_weights
-        for i in range(1, len(input_x)+1):
-            node_list = list(nx.dfs_preorder_nodes(reverse_graph, source=i))
-            reversed_total_weight = 0
-            for node in node_list:
-                reversed_total_weight += reverse_graph.nodes[node]['time']
-            graph.nodes[i]['reversed_total_weight'] = reversed_total_weight
-
-        return graph
-    
     def create_input_dict(self, task_list):
         input_nodes = []
         input_weights = []
@@ -70,13 +50,90 @@ class Line():
             input_weights.append(i[2])
 
         return dict(zip(input_nodes, input_weights))
+
+    def create_time_array(self, task_list):
+        # task times indexed by task number, index 0 is the dummy start node
+        times = [0]*(len(task_list)+1)
+        for i in task_list:
+            times[i[0]] = i[2]
+        times = np.array(times)
+        # integer task times fit in 32 bits, fractional times stay float64
+        if times.dtype.kind == 'i':
+            times = times.astype(np.int32)
+        return times
+    
+    def create_adjacency_arrays(self, graph):
+        # CSR successor and predecessor lists indexed by task number
+        # dummy start(0) and end(-1) nodes are left out, row 0 holds the first tasks
+        succ_indptr = [0]
+        succ_idx = []
+        pred_indptr = [0]
+        pred_idx = []
+        for task in range(len(self.task_list)+1):
+            succ_idx += [i for i in graph.successors(task) if i != -1]
+            succ_indptr.append(len(succ_idx))
+            if task != 0:
+                pred_idx += [i for i in graph.predecessors(task) if i != 0]
+            pred_indptr.append(len(pred_idx))
+        self.succ_indptr = np.array(succ_indptr, dtype=np.int32)
+        self.succ_idx = np.array(succ_idx, dtype=np.int32)
+        self.pred_indptr = np.array(pred_indptr, dtype=np.int32)
+        self.pred_idx = np.array(pred_idx, dtype=np.int32)
+        # number of unassigned predecessors of each task
+        self.n_preds = np.diff(self.pred_indptr)
+
+    def create_topological_order(self):
+        remaining_pred = self.n_preds.tolist()
+        # row 0 can also hold tasks that have real predecessors, start from the counters
+        order = [task[0] for task in self.task_list if remaining_pred[task[0]] == 0]
+        for task in order:
+            for successor in self.get_successors(task):
+                remaining_pred[successor] -= 1
+                if remaining_pred[successor] == 0:
+                    order.append(successor)
+        return order
+
+    def create_reachable_masks(self):
+        # bit i of reachable[task] is set when task i can be reached from task, itself included
+        # one reverse topological pass, so shared successors are counted once
+        reachable = [0]*(len(self.task_list)+1)
+        for task in reversed(self.topological_order):
+            mask = 1 << task
+            for successor in self.get_successors(task):
+                mask |= reachable[successor]
+            reachable[task] = mask
+        return reachable
+
+    def create_total_weights(self):
+        # total_weight = task time + times of all tasks reachable from it
+        total_weight = np.zeros_like(self.times)
+        for task in self.topological_order:
+            mask = self.reachable[task]
+            total_weight[task] = self.times[[i for i, bit in enumerate(bin(mask)[:1:-1]) if bit == '1']].sum()
+        return total_weight
+
+    def create_reversed_total_weights(self):
+        # reversed_total_weight = task time + times of all tasks it can be reached from
+        # ancestor masks are built in topological order over the predecessor lists
+        ancestors = [0]*(len(self.task_list)+1)
+        reversed_total_weight = np.zeros_like(self.times)
+        for task in self.topological_order:
+            mask = 1 << task
+            for predecessor in self.get_predecessors(task):
+                mask |= ancestors[predecessor]
+            ancestors[task] = mask
+            reversed_total_weight[task] = self.times[[i for i, bit in enumerate(bin(mask)[:1:-1]) if bit == '1']].sum()
+        return reversed_total_weight
+
+    def get_successors(self, task_number):
+        return self.succ_idx[self.succ_indptr[task_number]:self.succ_indptr[task_number+1]].tolist()
+
+    def get_predecessors(self, task_number):
+        return self.pred_idx[self.pred_indptr[task_number]:self.pred_indptr[task_number+1]].tolist()
     
     def total_work_time(self, station_list_):
-        total = 0
-        for station in station_list_:
-            for i in station:
-                total +=self.get_task_time(i)
-        return total
+        tasks = [i for station in station_list_ for i in station]
+        return self.times[tasks].sum().item()
     
     def calculate_loss_balance(self, station_list, cycle_time=0):
         loss_balance = 100 - self.calculate_line_efficiency(station_list, cycle_time)
@@ -84,17 +141,12 @@ class Line():
     
     def calculate_line_efficiency(self, station_list, cycle_time=0):
         # calculates station times
-        station_times = []
-        for i in range(len(station_list)):
-            station_times.append(self.get_station_time(station_list[i]))
+        station_times = self.get_station_times(station_list)
+        max_time = station_times.max()
         if cycle_time == 0:     
-            cycle_time = max(station_times)
+            cycle_time = max_time
         # calculate smootness Index
-        s = 0
-        for i in range(len(station_list)):
-            s = s + ((np.max(station_times)-station_times[i])**2)
-
-        smooth_index = np.sqrt(s)
+        smooth_index = self.smooth_index_of_times(station_times, max_time)
 
         # calculate line efficiency
         line_efficiency = 100 - ((100*smooth_index)/(len(station_times)*cycle_time))
@@ -103,216 +155,262 @@ class Line():
     
     def calculate_smooth_index(self, station_list, cycle_time=0):
         # calculates station times
-        station_times = []
-        for i in range(len(station_list)):
-            station_times.append(self.get_station_time(station_list[i]))
-        if cycle_time == 0:     
-            cycle_time = max(station_times)
+        station_times = self.get_station_times(station_list)
         # calculate smootness Index
-        s = 0
-        for i in range(len(station_list)):
-            s = s + ((np.max(station_times)-station_times[i])**2)
-
-        smooth_index = np.sqrt(s)
+        smooth_index = self.smooth_index_of_times(station_times, station_times.max())
         return smooth_index
+
+    def smooth_index_of_times(self, station_times, max_time):
+        return np.linalg.norm(max_time - station_times)
         
     def get_station_time(self, station):
-        total_task_time = 0
-        for weight_num in station:
-            total_task_time += self.input_dictionary.get(weight_num)
-        return total_task_time
-    # largest candidate rule
+        return self.times[list(station)].sum().item()
+
+    def get_station_times(self, station_list):
+        # all station times with one gather and one bincount, empty stations get 0
+        station_of_task = np.repeat(np.arange(len(station_list)), [len(station) for station in station_list])
+        tasks = [task for station in station_list for task in station]
+        return np.bincount(station_of_task, weights=self.times[tasks], minlength=len(station_list))
+
+    # largest candidate rule, (task, total weight) pairs from the heaviest
     def find_weighed_successor(self, list_):
-        node_list = {}
-        for node in list_:
-            node_list[node] = self.graph.nodes[node]['total_weight']
-        sorted_list = sorted(node_list.items(), key=lambda x: x[1], reverse=True)
-        return sorted_list
-    
-    # helgeson-birnie method
+        node_list = dict(zip(list_, self.total_weight[list_].tolist()))
+        return sorted(node_list.items(), key=itemgetter(1), reverse=True)
+
+    # helgeson-birnie method, (task, number of successors) pairs from the largest
+    # the count includes the task itself and the dummy end node
     def find_number_successor(self, list_):
-        node_list = {}
-        for node in list_:
-            node_list[node] = len(list(nx.dfs_preorder_nodes(self.graph, source=node)))
-        sorted_list = sorted(node_list.items(), key=lambda x: x[1], reverse=True)
-        return sorted_list
+        node_list = dict(zip(list_, (self.successor_count[list_] + 1).tolist()))
+        return sorted(node_list.items(), key=itemgetter(1), reverse=True)
+
+    # candidate with the largest weight among the ones that still fit in the station
+    # ties go to the candidate reached first, same as a stable descending sort
+    def find_largest_candidate(self, list_, weights, station_time, cycle_time):
+        fitting = [node for node, time in zip(list_, self.times[list_].tolist()) if station_time+time <= cycle_time]
+        if len(fitting) == 0:
+            return None
+        return max(fitting, key=weights.__getitem__)
     
-    def find_reversed_candidate_list(self, list1_, list2_, graph_):
-        node_list = {}
-        for node in list1_:
-            node_list[node] = graph_.nodes[node]['reversed_total_weight']
-        for node in list2_:
-            node_list[node] = graph_.nodes[node]['total_weight']
-        sorted_list = sorted(node_list.items(), key=lambda x: x[1], reverse=True)
+    # behind candidates weigh their reversed total weight, front ones their total weight
+    # keys are in tie order: behind candidates first, then front-only ones
+    def find_reversed_weights(self, list1_, list2_):
+        node_list = dict(zip(list1_, self.reversed_total_weight[list1_].tolist()))
+        node_list.update(zip(list2_, self.total_weight[list2_].tolist()))
+        return node_list
+
+    # graph_ is not used, weights come from the line itself
+    def find_reversed_candidate_list(self, list1_, list2_, graph_=None):
+        node_list = self.find_reversed_weights(list1_, list2_)
+        sorted_list = sorted(node_list.items(), key=itemgetter(1), reverse=True)
         return sorted_list
     
     
     # lcr = largest candidate
     # hb = helgeson birnie method
     def heuristic_method(self, cycle_time, method = 'lcr'):
-        G = copy.deepcopy(self.graph)
+        if (cycle_time, method) in self.heuristic_results:
+            return [station[:] for station in self.heuristic_results[(cycle_time, method)]]
+        remaining_pred = self.n_preds.tolist()
+        # unassigned tasks that have an assigned predecessor, in the order they were reached
+        reached = dict.fromkeys(self.get_successors(0))
         stations = []
         station_list = []
-        # find 0's successors
-        is_finished = False
-        while(is_finished==False):
-            is_added = False
-            new_successors_list = list(G.successors(0))
-            for eliminate in new_successors_list:
-                if (sum(list(G.predecessors(eliminate))) > 0) | (eliminate == -1):
-                    new_successors_list.remove(eliminate)
-
-            if (method == 'lcr'):
-                candidate_list = self.find_weighed_successor(new_successors_list)
+        station_time = 0
+        if (method == 'lcr'):
+            # largest candidate rule
+            weights = self.total_weight.tolist()
+        else:
+            # helgeson-birnie method
+            weights = self.successor_count.tolist()
+        while(len(reached) > 0):
+            new_successors_list = [task for task in reached if remaining_pred[task] == 0]
+
+            node = self.find_largest_candidate(new_successors_list, weights, station_time, cycle_time)
+            if node is not None:
+                stations.append(node)
+                station_time += self.times[node]
             else:
-                candidate_list = self.find_number_successor(new_successors_list)
-
-            node_list = {}
-            for node in new_successors_list:
-                node_list[node] = len(list(nx.dfs_preorder_nodes(G, source=node)))
-                sorted_list = sorted(node_list.items(), key=lambda x: x[1], reverse=True)
-                is_added = False
-
-            for node_number in candidate_list:
-                new_node_time = G.nodes[node_number[0]]['time']
-                if self.get_station_time(stations)+new_node_time <= cycle_time:
-                    is_added = True
-                    stations.append(node_number[0])
-                    for success_num in list(G.successors(node_number[0])):
-                        G.add_edge(0, success_num)
-                    G.remove_edges_from(list(G.edges(node_number[0])))
-                    G.remove_edge(0,node_number[0])
-                    break
-
-            if is_added == False:
-                station_list.append(stations)
-                stations = []
-                stations.append(candidate_list[0][0])
-                for success_num in list(G.successors(candidate_list[0][0])):
-                    G.add_edge(0, success_num)
-                G.remove_edges_from(list(G.edges(candidate_list[0][0])))
-                G.remove_edge(0, candidate_list[0][0])
-
-            if (G.number_of_edges() == 1):
-                is_finished = True
                 station_list.append(stations)
-            
+                node = max(new_successors_list, key=weights.__getitem__)
+                stations = [node]
+                station_time = self.times[node]
+
+            del reached[stations[-1]]
+            for success_num in self.get_successors(stations[-1]):
+                remaining_pred[success_num] -= 1
+                reached.setdefault(success_num)
+
+        station_list.append(stations)
+        self.heuristic_results[(cycle_time, method)] = [station[:] for station in station_list]
         return station_list
-    
+
+    # deterministic depth-first search over full station loads
+    # bounded by the best solution found and ceil(remaining time / cycle_time)
+    # iteration = maximum number of search nodes
+    def iterative_method(self, cycle_time, iteration=100000):
+        tasks = [task[0] for task in self.task_list]
+        times = self.times.tolist()
+        pred_mask = {}
+        for task in tasks:
+            pred_mask[task] = 0
+            for predecessor in self.get_predecessors(task):
+                pred_mask[task] |= 1 << predecessor
+        all_assigned = 0
+        for task in tasks:
+            all_assigned |= 1 << task
+        # start from the better heuristic, the search only keeps solutions with fewer stations
+        best = min(self.heuristic_method(cycle_time, 'lcr'), self.heuristic_method(cycle_time, 'hb'), key=len)
+        lower_bound = int(np.ceil(sum(times) / cycle_time))
+        seen = set()
+        nodes = 0
+
+        # explicit stack instead of recursion, deep lines would hit the recursion limit
+        # entry = (assigned, closed stations, tasks in open station, station time, remaining time, placements)
+        # placements is a linked list (task, previous placements), task -1 closes a station
+        stack = [(0, 0, 0, 0, sum(times), None)]
+        while len(stack) > 0:
+            assigned, n_closed, n_open, station_time, remaining_time, placements = stack.pop()
+            if assigned == all_assigned:
+                moves = []
+                while placements is not None:
+                    moves.append(placements[0])
+                    placements = placements[1]
+                best = [[]]
+                for task in reversed(moves):
+                    if task == -1:
+                        best.append([])
+                    else:
+                        best[-1].append(task)
+                continue
+            nodes += 1
+            if (nodes > iteration) or (len(best) == lower_bound):
+                continue
+            overflow = max(0, remaining_time - (cycle_time - station_time))
+            if n_closed + 1 + int(np.ceil(overflow / cycle_time)) >= len(best):
+                continue
+            state = (assigned, n_closed, station_time)
+            if state in seen:
+                continue
+            seen.add(state)
+
+            children = []
+            for task in tasks:
+                if (assigned >> task) & 1:
+                    continue
+                if (pred_mask[task] & assigned != pred_mask[task]) or (station_time + times[task] > cycle_time):
+                    continue
+                children.append((assigned | (1 << task), n_closed, n_open + 1, station_time + times[task],
+                                 remaining_time - times[task], (task, placements)))
+
+            # station is full, open the next one
+            if (len(children) == 0) and (n_open > 0):
+                children.append((assigned, n_closed + 1, 0, 0, remaining_time, (-1, placements)))
+            # pushed in reverse so they are searched in task order
+            stack += reversed(children)
+        return best
+
     # B: behind, F: front
     # lcr = largest candidate
     # hb = helgeson birnie method
     def u_type_balance(self, cycle_time, method = 'lcr'):
         first = True
-        G = copy.deepcopy(self.graph)
-        G = self.create_graph_for_ushape(self.task_list, G)
+        times = self.times.tolist()
         stations = []
+        station_time = 0
         station_list = []
         front_behind_arr = []
-        is_finished = False
-        while(is_finished == False):
-            new_successors_list = list(G.successors(0))
-            new_predecessors_list = list(G.predecessors(-1))
-
+        # unassigned predecessors(front) and successors(behind) of each task
+        remaining_pred = self.n_preds.tolist()
+        remaining_succ = np.diff(self.succ_indptr).tolist()
+        # unassigned tasks reached from the start(front) and from the end(behind), in the order they were reached
+        front = dict.fromkeys(self.get_successors(0))
+        behind = dict.fromkeys(task for task in self.graph.predecessors(-1) if task != 0)
+        assigned = [False]*(len(self.task_list)+1)
+        n_assigned = 0
+        while(n_assigned < len(self.task_list)):
             #feasible_list
-            for eliminate in new_successors_list:
-                if sum(list(G.predecessors(eliminate))) > 0:
-                    new_successors_list.remove(eliminate)
-            for eliminate in new_predecessors_list:
-                if sum(list(G.successors(eliminate))) > 0:
-                    new_predecessors_list.remove(eliminate)
-
-            candidate_list = self.find_reversed_candidate_list(new_predecessors_list, new_successors_list, G)
+            new_successors_list = [task for task in front if remaining_pred[task] == 0]
+            new_predecessors_list = [task for task in behind if remaining_succ[task] == 0]
+            # side of each feasible task, looked up instead of searching both lists
+            sides = dict.fromkeys(new_successors_list, 'F')
+            for task in new_predecessors_list:
+                sides[task] = 'F-B' if task in sides else 'B'
+
             if first == True:
+                # the first pick swaps the heaviest and the lightest candidate, so it needs the full order
+                candidate_list = self.find_reversed_candidate_list(new_predecessors_list, new_successors_list)
                 candidate_list[0], candidate_list[-1] = candidate_list[-1], candidate_list[0]
                 first = False
-            is_added = False
-            for node_number in candidate_list:
-                new_node_time = G.nodes[node_number[0]]['time']
-                if self.get_station_time(stations)+new_node_time <= cycle_time:
-                    if (node_number[0] in new_successors_list) and (node_number[0] in new_predecessors_list):
-                        front_behind_arr.append('F-B')
-                        is_added = True
-                        stations.append(node_number[0])
-                        for success_num in list(G.successors(node_number[0])):
-                            G.add_edge(0, success_num)
-                        G.remove_edges_from(list(G.edges(node_number[0])))
-                        G.remove_edge(0,node_number[0])
-                        break
-                    elif (node_number[0] in new_predecessors_list):
-                        front_behind_arr.append('B')
-                        is_added = True
-                        stations.append(node_number[0])
-                        for predecc_num in list(G.predecessors(node_number[0])):
-                            G.add_edge(predecc_num, -1)
-                            G.remove_edge(predecc_num, node_number[0])
-                        #G.remove_edges_from(list(G.edges(node_number[0])))
-                        G.remove_edge(node_number[0],-1)
-                        break
-                    else:
-                        front_behind_arr.append('F')
-                        is_added = True
-                        stations.append(node_number[0])
-                        for success_num in list(G.successors(node_number[0])):
-                            G.add_edge(0, success_num)
-                        G.remove_edges_from(list(G.edges(node_number[0])))
-                        G.remove_edge(0,node_number[0])
-                        break
+                node = next((node for node, weight in candidate_list if station_time+times[node] <= cycle_time), None)
+                # task that opens a new station when nothing fits
+                opening = candidate_list[0][0]
+            else:
+                weights = self.find_reversed_weights(new_predecessors_list, new_successors_list)
+                node = self.find_largest_candidate(list(weights), weights, station_time, cycle_time)
+                opening = max(weights, key=weights.__getitem__)
 
-            if is_added == False:
+            if node is not None:
+                stations.append(node)
+                station_time += times[node]
+            else:
                 station_list.append(stations)
                 stations = []
-                if (candidate_list[0][0] in new_successors_list) and (candidate_list[0][0] in new_predecessors_list):
-                    stations.append(candidate_list[0][0])
-                    front_behind_arr.append('F-B')
-                    for success_num in list(G.successors(candidate_list[0][0])):
-                         G.add_edge(0, success_num)
-                    G.remove_edges_from(list(G.edges(candidate_list[0][0])))
-                    G.remove_edge(0, candidate_list[0][0])
-                elif (candidate_list[0][0] in new_predecessors_list):
-                    stations.append(candidate_list[0][0])
-                    front_behind_arr.append('B')
-                    for predecc_num in list(G.predecessors(candidate_list[0][0])):
-                        G.add_edge(predecc_num, -1)
-                        G.remove_edge(predecc_num, candidate_list[0][0])
-                    #G.remove_edges_from(list(G.edges(node_number[0])))
-                    G.remove_edge(candidate_list[0][0],-1)
-                else:
-                    stations.append(candidate_list[0][0])
-                    front_behind_arr.append('F')
-                    for success_num in list(G.successors(candidate_list[0][0])):
-                         G.add_edge(0, success_num)
-                    G.remove_edges_from(list(G.edges(candidate_list[0][0])))
-                    G.remove_edge(0, candidate_list[0][0])
-            if (len(list(G.successors(0))) == 1) & (list(G.successors(0))[0] == -1):
-                is_finished = True
-                station_list.append(stations)
+                stations.append(opening)
+                station_time = times[opening]
+            front_behind_arr.append(sides[stations[-1]])
+            if sides[stations[-1]] == 'B':
+                self.place_behind(stations[-1], remaining_succ, assigned, front, behind)
+            else:
+                self.place_front(stations[-1], remaining_pred, assigned, front, behind)
+            n_assigned += 1
+        station_list.append(stations)
         return station_list, front_behind_arr
     
+    # u-type placements: the task leaves both frontiers and opens its unassigned neighbours on its side
+    def place_front(self, task, remaining_pred, assigned, front, behind):
+        assigned[task] = True
+        front.pop(task, None)
+        behind.pop(task, None)
+        for success_num in self.get_successors(task):
+            remaining_pred[success_num] -= 1
+            if not assigned[success_num]:
+                front.setdefault(success_num)
+
+    def place_behind(self, task, remaining_succ, assigned, front, behind):
+        assigned[task] = True
+        front.pop(task, None)
+        behind.pop(task, None)
+        for predecc_num in self.get_predecessors(task):
+            remaining_succ[predecc_num] -= 1
+            if not assigned[predecc_num]:
+                behind.setdefault(predecc_num)
+
     ## ---------------------------------------------------------- ##
     ## ---------------------------------------------------------- ##
     ## ---------------------------------------------------------- ##
     ## ---------------------------------------------------------- ##
-    def remove_non_feasibles(self, list_, G_):
-        remove_list = []
-        for i in range(len(list_)):
-            if sum(list(G_.predecessors(list_[i]))) > 0:
-                remove_list.append(i)
-        for i in range(len(remove_list)):
-            del list_[remove_list.pop()]
-        return list_
-    
+    # drops repeated station lists, keeps first appearance order
+    def unique_solutions(self, solution_list):
+        unique_list_tasks = {}
+        for x in solution_list:
+            unique_list_tasks.setdefault(tuple(tuple(station) for station in x), x)
+        return list(unique_list_tasks.values())
+
     def heuristic_task_allocating(self, task_path, cycle_time):
         station_list_ = []
         station = []
-        for task in task_path:
-            if(self.get_station_time(station) + self.input_dictionary[task] <= cycle_time):
+        station_time = 0
+        # task times gathered once as python numbers, numpy scalar indexing per task is slow
+        for task, task_time in zip(task_path, self.times[task_path].tolist()):
+            if(station_time + task_time <= cycle_time):
                 station.append(task)
+                station_time += task_time
 
             else:
                 station_list_.append(station)
                 station = []
                 station.append(task)
+                station_time = task_time
 
         station_list_.append(station)
         return station_list_
@@ -321,111 +419,70 @@ class Line():
         p_m = 0.7 
         pop = 30 
         gen = 15
+        # genetics stops after this many generations without a better best score
+        patience = 5
+        # mutations never change the task order, every solution is kept as its station borders
+        # station i is tasks[borders[i]:borders[i+1]]
+        tasks = [task for station in initial_list for task in station]
+        task_times = self.times[tasks].tolist()
+        time_sums = self.create_time_sums(task_times)
+        initial_borders = [0]
+        for station in initial_list:
+            initial_borders.append(initial_borders[-1] + len(station))
+        # children already made in this call, by (parent borders, moved station)
+        children = {}
         all_stations = []
-        all_stations.append(initial_list)
+        all_stations.append(initial_borders)
         for i in range(pop-1):
-            station_created = copy.deepcopy(initial_list)
-            # probability 2: move right(k) to left(k+1), move right(k+1) to left(k+2) ...      
-            k = rd.randint(0,len(station_created)-1)
-            if len(station_created[k])>1:
-                if(len(station_created)==k+1):
-                    station_created.append([])
-                station_created[k+1].insert(0, station_created[k][-1])
-                station_created[k].pop()
-            #bozulanları düzelt;
-            for i in range(k, len(station_created)):
-                isFinished = False
-                while(isFinished==False):
-                    if(self.get_station_time(station_created[i]) > cycle_time):
-                        if(len(station_created)<=i+1):
-                            station_created.append([])
-                        station_created[i+1].insert(0, station_created[i][-1])
-                        station_created[i].pop()
-                        if(self.get_station_time(station_created[i]) <= cycle_time):
-                            isFinished = True  
-                    else:
-                        isFinished = True 
+            station_created = self.mutation_borders(initial_borders, task_times, time_sums, cycle_time, children)
             all_stations.append(station_created)
         if (local_search == "local"):
-            unique_list_tasks = []
-            for x in all_stations:
-                if x not in unique_list_tasks:
-                    unique_list_tasks.append(x)
-            return unique_list_tasks
+            return self.unique_solutions([self.split_tasks(tasks, borders) for borders in all_stations])
         elif(local_search == "genetics") :
             X0 = all_stations[:]
+            # children are scored once when their generation ends and reused as the next X0 scores
+            X0_scores = self.calculate_borders_efficiency(X0, task_times, time_sums)
+            # X0[0] is the initial solution, its score does not change between generations
+            initial_score = X0_scores[0]
 
             generation = 1
             Save_bests  = []
+            best_score = -np.inf
+            stagnation = 0
 
             for i in range(gen):
                 new_population = []
 
                 All_in_Generation_childs = []
 
-                All_in_Generation_childs_scores = []
-
-                Total_Cost_Mut = self.calculate_line_efficiency(initial_list)
-                All_in_Generation_childs.append(initial_list)
-                All_in_Generation_childs_scores.append(Total_Cost_Mut)
+                All_in_Generation_childs.append(initial_borders)
 
                 #print("----> Generation: #", generation)
 
+                # all tournaments of the generation are drawn at once, 3 different warriors in each row
+                Warriors = np.argpartition(np.random.rand(int(pop)-1, len(X0)), 3, axis=1)[:, :3]
+                # first warrior with the highest prize wins
+                Winners = Warriors[np.arange(len(Warriors)), np.argmax(X0_scores[Warriors], axis=1)]
+                Mutates = np.random.rand(len(Winners)) < p_m
+
                 family = 1
 
                 for j in range(int(pop)-1):
-                    Parents = []
-                    Warrior_1_index = np.random.randint(0,len(X0))
-                    Warrior_2_index = np.random.randint(0,len(X0))
-                    Warrior_3_index = np.random.randint(0,len(X0))
-
-                    while Warrior_1_index == Warrior_2_index:
-                        Warrior_1_index = np.random.randint(0, len(X0))
-
-                    while Warrior_2_index == Warrior_3_index:
-                        Warrior_3_index = np.random.randint(0, len(X0))
-
-                    while Warrior_1_index == Warrior_3_index:
-                        Warrior_3_index = np.random.randint(0, len(X0))
-
-                    Warrior_1 = X0[Warrior_1_index]
-                    Warrior_2 = X0[Warrior_2_index]
-                    Warrior_3 = X0[Warrior_3_index]
-
-                    # calculate distances for warriors
-                    Prize_Warrior_1 = self.calculate_line_efficiency(Warrior_1)
-
-                    Prize_Warrior_2 = self.calculate_line_efficiency(Warrior_2)
-
-                    Prize_Warrior_3 = self.calculate_line_efficiency(Warrior_3)
-
-                    if Prize_Warrior_1 == max(Prize_Warrior_1, Prize_Warrior_2, Prize_Warrior_3):
-                        Winner = Warrior_1
-                    elif Prize_Warrior_2 == max(Prize_Warrior_1, Prize_Warrior_2, Prize_Warrior_3):
-                        Winner = Warrior_2
-                    else:
-                        Winner = Warrior_3
-
-                    Parents.append(Winner)
-
-                    parent_1 = Parents[0]
-                    Mutated_Child_1 = []
-                    prob_mut = np.random.rand()
-                    if prob_mut < p_m:
-                        Mutated_Child = self.mutation_local(parent_1, cycle_time)
+                    parent_1 = X0[Winners[j]]
+                    if Mutates[j]:
+                        Mutated_Child = self.mutation_borders(parent_1, task_times, time_sums, cycle_time, children)
                     else: 
                         Mutated_Child = parent_1
 
-                    Total_Cost_Mut = self.calculate_line_efficiency(Mutated_Child)
-                    # print('Child: ', Mutated_Child, 'Score: ', Total_Cost_Mut)
                     family += 1 
 
                     All_in_Generation_childs.append(Mutated_Child)
-                    All_in_Generation_childs_scores.append(Total_Cost_Mut)
-                    index_of_best = All_in_Generation_childs_scores.index(max(All_in_Generation_childs_scores))
 
                     new_population.append(Mutated_Child)
                 X0 = new_population[:]
+                X0_scores = self.calculate_borders_efficiency(X0, task_times, time_sums)
+                All_in_Generation_childs_scores = np.concatenate(([initial_score], X0_scores))
+                index_of_best = int(np.argmax(All_in_Generation_childs_scores))
                 #Save_best_in_generation.append([
                 #    All_in_Generation_childs[index_of_best], 
                 #    All_in_Generation_childs_scores[index_of_best]
@@ -433,63 +490,129 @@ class Line():
                 Save_bests.append(All_in_Generation_childs[index_of_best])
 
                 generation += 1
-            unique_list_tasks = []
-            for x in Save_bests:
-                if x not in unique_list_tasks:
-                    unique_list_tasks.append(x)
-            return unique_list_tasks
+                if All_in_Generation_childs_scores[index_of_best] > best_score:
+                    best_score = All_in_Generation_childs_scores[index_of_best]
+                    stagnation = 0
+                else:
+                    stagnation += 1
+                    if stagnation == patience:
+                        break
+            return self.unique_solutions([self.split_tasks(tasks, borders) for borders in Save_bests])
+
+    def split_tasks(self, tasks, borders):
+        return [tasks[borders[i]:borders[i+1]] for i in range(len(borders)-1)]
     
+    # prefix sums of the task times in a shared task order, time_sums[i] = total time of the first i tasks
+    # differences of float prefix sums are not exact (8.900000000000002 > 8.9), float times get None
+    def create_time_sums(self, task_times):
+        if self.times.dtype.kind == 'i':
+            return np.concatenate(([0], np.cumsum(task_times)))
+        return None
+
+    # time of tasks[start:end], float stations are summed task by task like get_station_time
+    def span_time(self, task_times, time_sums, start, end):
+        if time_sums is None:
+            return sum(task_times[start:end])
+        return time_sums[end] - time_sums[start]
+
+    def calculate_borders_efficiency(self, population, task_times, time_sums, cycle_time=0):
+        # line efficiency of every border list at once
+        # borders are padded with their last value to (pop, max stations+1), padding stations are masked
+        n_stations = np.array([len(borders)-1 for borders in population])
+        max_stations = n_stations.max()
+        padded_borders = np.array([borders + [borders[-1]]*(max_stations+1-len(borders)) for borders in population])
+        if time_sums is None:
+            station_times = np.array([[self.span_time(task_times, None, borders[i], borders[i+1]) for i in range(max_stations)]
+                                      for borders in padded_borders.tolist()])
+        else:
+            station_times = np.diff(time_sums[padded_borders], axis=1)
+        real_station = np.arange(max_stations) < n_stations[:, None]
+        max_times = station_times.max(axis=1)
+        if cycle_time == 0:
+            cycle_time = max_times
+        smooth_index = np.linalg.norm(np.where(real_station, max_times[:, None] - station_times, 0), axis=1)
+        return 100 - ((100*smooth_index)/(n_stations*cycle_time))
+
     def mutation_local(self, station_list_, cycle_time):
-        station_created = copy.deepcopy(station_list_)
+        tasks = [task for station in station_list_ for task in station]
+        task_times = self.times[tasks].tolist()
+        borders = [0]
+        for station in station_list_:
+            borders.append(borders[-1] + len(station))
+        return self.split_tasks(tasks, self.mutation_borders(borders, task_times, self.create_time_sums(task_times), cycle_time, {}))
+
+    def mutation_borders(self, borders_, task_times, time_sums, cycle_time, memo):
         # probability 2: move right(k) to left(k+1), move right(k+1) to left(k+2) ...      
-        k = rd.randint(0,len(station_created)-1)
-        if len(station_created[k])>1:
-            if(len(station_created)==k+1):
-                station_created.append([])
-            station_created[k+1].insert(0, station_created[k][-1])
-            station_created[k].pop()
+        k = rd.randrange(len(borders_)-1)
+        # the child only depends on the parent and k, repeated parents are not repaired again
+        key = (tuple(borders_), k)
+        if key not in memo:
+            memo[key] = self.move_border(borders_, k, task_times, time_sums, cycle_time)
+        return memo[key]
+
+    def move_border(self, borders_, k, task_times, time_sums, cycle_time):
+        # only the borders between stations move
+        borders = borders_[:]
+        if borders[k+1] - borders[k] > 1:
+            if len(borders) == k+2:
+                borders.append(borders[-1])
+            borders[k+1] -= 1
         #bozulanları düzelt;
-        for i in range(k, len(station_created)):
-            isFinished = False
-            while(isFinished==False):
-                if(self.get_station_time(station_created[i]) > cycle_time):
-                    if(len(station_created)<=i+1):
-                        station_created.append([])
-                    station_created[i+1].insert(0, station_created[i][-1])
-                    station_created[i].pop()
-                    if(self.get_station_time(station_created[i]) <= cycle_time):
-                        isFinished = True  
-                else:
-                    isFinished = True 
-        return station_created
-    def comsoal_algorithm(self, cycle_time, iteration=100, local_search = 'heuristic'):
+        for i in range(k, len(borders)-1):
+            while self.span_time(task_times, time_sums, borders[i], borders[i+1]) > cycle_time:
+                if len(borders) <= i+2:
+                    borders.append(borders[-1])
+                borders[i+1] -= 1
+        return borders
+    # tasks of list_ whose predecessors are all assigned, remaining_pred defaults to the unassigned line
+    def remove_non_feasibles(self, list_, remaining_pred=None):
+        if remaining_pred is None:
+            remaining_pred = self.n_preds
+        return [task for task in list_ if remaining_pred[task] == 0]
+
+    # one random precedence feasible task sequence
+    # ready tasks are kept in a list, picked one is swapped with the last and popped
+    def comsoal_sequence(self):
+        remaining_pred = self.n_preds.tolist()
+        # row 0 can also hold tasks that still wait for real predecessors
+        ready = [task for task in self.get_successors(0) if remaining_pred[task] == 0]
+        task_list = []
+        while(len(ready) > 0):
+            k = rd.randrange(len(ready))
+            ready[k], ready[-1] = ready[-1], ready[k]
+            candidate = ready.pop()
+            task_list.append(candidate)
+            for success_num in self.get_successors(candidate):
+                remaining_pred[success_num] -= 1
+                if remaining_pred[success_num] == 0:
+                    ready.append(success_num)
+        return task_list
+
+    def comsoal_iteration(self, cycle_time, local_search = 'heuristic', seed=None):
+        if seed is not None:
+            rd.seed(seed)
+            np.random.seed(seed)
+        task_list = self.comsoal_sequence()
+        #### BU KISIMA LOCAL SEARCH PROCEDURE EKLENECEK
+        station_list = self.heuristic_task_allocating(task_list, cycle_time)
+        if (local_search != 'heuristic'):
+            return self.local_search_procedure(station_list, cycle_time, local_search=local_search)
+        return [station_list]
+
+    # n_jobs = number of worker processes, -1 uses all cores
+    def comsoal_algorithm(self, cycle_time, iteration=100, local_search = 'heuristic', n_jobs=1):
         generation_list = []
-        for i in range(iteration):
-            G = copy.deepcopy(self.graph)
-            task_list = []
-            is_finished = False
-            while(is_finished == False):
-                new_successors_list = list(G.successors(0))
-                feasible_list = self.remove_non_feasibles(new_successors_list, G)
-                candidate = rd.choice(feasible_list)
-                # adding selected to list
-                # adding selected to list
-                task_list.append(candidate)
-                for success_num in list(G.successors(candidate)):
-                    G.add_edge(0, success_num)
-                G.remove_edges_from(list(G.edges(candidate)))
-                G.remove_edge(0, candidate)
-                if (len(list(G.successors(0))) == 1) & (list(G.successors(0))[0] == -1):
-                    is_finished = True
-            #### BU KISIMA LOCAL SEARCH PROCEDURE EKLENECEK
-            station_list = self.heuristic_task_allocating(task_list, cycle_time)
-            if (local_search != 'heuristic'):
-                station_list = line.local_search_procedure(station_list, cycle_time, local_search=local_search)
-                generation_list +=station_list
-            else:
-                generation_list.append(station_list)
-        unique_list_tasks = []
-        for x in generation_list:
-            if x not in unique_list_tasks:
-                unique_list_tasks.append(x)
-        return unique_list_tasks
\ No newline at end of file
+        if n_jobs == 1:
+            for i in range(iteration):
+                generation_list += self.comsoal_iteration(cycle_time, local_search)
+        else:
+            if n_jobs == -1:
+                n_jobs = os.cpu_count()
+            # iterations are independent, each one gets its own seed so workers do not repeat draws
+            seeds = [rd.randrange(2**32) for i in range(iteration)]
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                results = executor.map(self.comsoal_iteration, [cycle_time]*iteration, [local_search]*iteration, seeds,
+                                       chunksize=max(1, iteration//(4*n_jobs)))
+                for station_lists in results:
+                    generation_list += station_lists
+        return self.unique_solutions(generation_list)
\ No newline at end of file